@@ -1,34 +1,64 @@
-from fastapi import FastAPI, HTTPException
-from typing import Any, Dict
-import tempfile
-import json
-import os
-from rag_lite import enrich_payload_with_rag
+import asyncio
+import logging
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse
+import orjson
+from rag_lite import enrich_payload_with_rag_dict
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
-@app.post("/optimize_sql")
-async def optimize_sql(payload: Dict[str, Any], max_context_tokens: int = 200000):
-    try:
-        print("Received payload:", payload)
-        
-        # Save incoming payload to a temp file
-        with tempfile.NamedTemporaryFile(mode='w+', suffix='.json', delete=False) as temp_file:
-            json.dump(payload, temp_file, indent=2)
-            temp_file_path = temp_file.name
+app = FastAPI(default_response_class=ORJSONResponse)
 
-        # Enrich payload with RAG-lite (now with max_context_tokens parameter)
-        enrich_payload_with_rag(temp_file_path, max_context_tokens=max_context_tokens)
+# The handler reads the raw body, so describe it for the OpenAPI schema by hand
+_PAYLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {"application/json": {"schema": {"type": "object", "title": "Payload"}}},
+}
 
-        # Read back the enriched payload
-        with open(temp_file_path, 'r') as f:
-            enriched_payload = json.load(f)
+def _parse_payload(body):
+    """Parse the request body into a dict, raising FastAPI-style validation errors
+    
+    Integers outside orjson's 64-bit range are parsed as floats, so very
+    large IDs lose precision instead of failing the request.
+    """
+    try:
+        payload = orjson.loads(body) if body else None
+    except orjson.JSONDecodeError as e:
+        raise RequestValidationError([
+            {"type": "json_invalid", "loc": ("body", e.pos), "msg": "JSON decode error",
+             "input": {}, "ctx": {"error": e.msg}}
+        ])
+    # Like FastAPI, an empty or null body counts as a missing one
+    if payload is None:
+        raise RequestValidationError([
+            {"type": "missing", "loc": ("body",), "msg": "Field required", "input": None}
+        ])
+    if not isinstance(payload, dict):
+        raise RequestValidationError([
+            {"type": "dict_type", "loc": ("body",), "msg": "Input should be a valid dictionary",
+             "input": payload}
+        ])
+    return payload
 
-        # Clean up temp file
-        os.unlink(temp_file_path)
+@app.post("/optimize_sql", openapi_extra={"requestBody": _PAYLOAD_REQUEST_BODY})
+async def optimize_sql(request: Request, max_context_tokens: int = 200000):
+    # Parse the raw body once with orjson instead of letting pydantic rebuild
+    # the whole (potentially huge) payload as a validated copy
+    payload = _parse_payload(await request.body())
+    
+    try:
+        logger.debug("Received payload: %s", payload)
+        
+        # Enrich payload with RAG-lite in memory (now with max_context_tokens parameter).
+        # The enrichment is CPU-bound, so run it in a worker thread to keep the
+        # event loop free for other requests
+        enriched_payload = await asyncio.to_thread(
+            enrich_payload_with_rag_dict, payload, max_context_tokens=max_context_tokens
+        )
         
-        print("Enriched payload:", enriched_payload)
+        logger.debug("Enriched payload: %s", enriched_payload)
         return {"enriched_payload": enriched_payload}
     except Exception as e:
-        print("Error:", e)
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        logger.exception("Error: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
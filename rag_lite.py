@@ -1,198 +1,230 @@
-import json
+import functools
+import heapq
+import io
+import logging
+import math
+import mmap
+import os
 import re
+import threading
+from collections import Counter, OrderedDict
+from itertools import chain, islice
+
+import ahocorasick
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Patterns are compiled once at import time so the keyword extractors and the
+# chunker don't go through re's pattern cache on every call.
+_IDENT_RE = re.compile(r'\b[A-Za-z][A-Za-z0-9_]*')
+_CAMEL_SPLIT_RE = re.compile(r'[A-Z]?[a-z]+|[A-Z]+(?=[A-Z][a-z]|\b)')
+_CLASS_RE = re.compile(r'(?:class|interface|enum)\s+([A-Za-z][A-Za-z0-9_]*)', re.IGNORECASE)
+_ANNOTATION_RE = re.compile(r'@([A-Za-z][A-Za-z0-9_]*)')
+_METHOD_RE = re.compile(r'(?:public|private|protected)?\s*\w+\s+([a-z][A-Za-z0-9_]*)\s*\(')
+_FIELD_RE = re.compile(r'(?:private|public|protected)\s+\w+\s+([a-zA-Z][a-zA-Z0-9_]*)')
+_PACKAGE_RE = re.compile(r'package\s+([a-zA-Z][a-zA-Z0-9_.]*)')
+_DB_TERMS_RE = re.compile(r'\b(entity|repository|service|controller|table|column|join|select|where|index|optimization|performance|query|sql|database|hibernate|jpa|spring|batch|cache|fetch|lazy|eager)\b', re.IGNORECASE)
+_TECH_TERMS_RE = re.compile(r'\b([A-Z][a-z]+(?:[A-Z][a-z]+)*|[a-z]+(?:[A-Z][a-z]+)+)\b')
+_PARA_SPLIT_RE = re.compile(r'\n\s*\n')
+_WORD_RE = re.compile(r'\S+')
+
+# Read files in one go through a large buffer
+_READ_BUFFER_SIZE = 1 << 20
+
+# Snippets sharing more than this fraction of their word shingles with a
+# higher-ranked snippet are treated as near-duplicates
+_NEAR_DUPLICATE_JACCARD = 0.8
+
+_STOP_WORDS = frozenset({
+    'the', 'a', 'an', 'in', 'on', 'of', 'is', 'are', 'and', 'or', 'to', 'from',
+    'for', 'with', 'by', 'at', 'as', 'be', 'this', 'that', 'it', 'if', 'not',
+    'but', 'can', 'get', 'set', 'new', 'old', 'all', 'any', 'has', 'had'
+})
+
+# SQL tokens that are pure syntax, or that hint at a specific optimization topic
+_SQL_KEYWORDS = frozenset({
+    'select', 'from', 'where', 'join', 'on', 'and', 'or', 'order', 'by', 'group',
+    'having', 'limit', 'distinct', 'count', 'sum', 'avg', 'max', 'min'
+})
+_SQL_OPERATIONS = frozenset({
+    'create', 'alter', 'drop', 'index', 'constraint', 'primary', 'foreign', 'key',
+    'batch', 'cache', 'fetch', 'lazy', 'eager'
+})
 
 def normalize_keywords(keywords):
-    """Normalize keywords by removing stopwords, short words, and duplicates"""
-    stop_words = {
-        'the', 'a', 'an', 'in', 'on', 'of', 'is', 'are', 'and', 'or', 'to', 'from', 
-        'for', 'with', 'by', 'at', 'as', 'be', 'this', 'that', 'it', 'if', 'not',
-        'but', 'can', 'get', 'set', 'new', 'old', 'all', 'any', 'has', 'had'
-    }
+    """Normalize keywords by removing stopwords, short words, and purely numeric values
     
-    normalized = set()
+    Lazily filters the incoming stream; deduplication is left to the caller.
+    """
     for keyword in keywords:
         keyword = str(keyword).lower().strip()
-        # Remove short words, stopwords, and purely numeric values
-        if len(keyword) > 2 and keyword not in stop_words and not keyword.isdigit():
-            normalized.add(keyword)
-    
-    return list(normalized)
+        if len(keyword) > 2 and keyword not in _STOP_WORDS and not keyword.isdigit():
+            yield keyword
+
+def stringify_payload_section(payload, section):
+    """Return the text view of each item in a payload section (e.g. 'repositories')
+    
+    Computed once per request and shared by keyword extraction and scoring;
+    orjson is much faster than str() on deeply nested dicts.
+    """
+    return [
+        item if isinstance(item, str) else orjson.dumps(item).decode()
+        for item in payload.get(section, [])
+    ]
 
-def extract_keywords_from_payload(payload_json_path):
-    """Extract keywords from the existing payload.json with improved extraction"""
-    with open(payload_json_path, 'r') as f:
-        payload = json.load(f)
+def extract_keywords_from_payload(payload, repo_texts=None, entity_texts=None):
+    """Extract keywords from the parsed payload with improved extraction"""
+    if repo_texts is None:
+        repo_texts = stringify_payload_section(payload, 'repositories')
+    if entity_texts is None:
+        entity_texts = stringify_payload_section(payload, 'entities')
     
-    keywords = set()
+    sources = []
     
     # Extract from SQL queries in the payload
-    if 'queries' in payload:
-        for query in payload['queries']:
-            sql = query.get('sql', '')
-            method = query.get('method_name', '')
-            keywords.update(extract_sql_keywords(sql, method))
+    for query in payload.get('queries', []):
+        sources.append(extract_sql_keywords(query.get('sql', ''), query.get('method_name', '')))
     
     # Extract from any messages/prompts in payload
-    if 'messages' in payload:
-        for message in payload['messages']:
-            content = message.get('content', '')
-            keywords.update(extract_content_keywords(content))
+    for message in payload.get('messages', []):
+        sources.append(extract_content_keywords(message.get('content', '')))
     
-    # Extract from repositories
-    if 'repositories' in payload:
-        for repo in payload['repositories']:
-            repo_content = str(repo)
-            keywords.update(extract_java_keywords(repo_content))
-    
-    # Extract from entities
-    if 'entities' in payload:
-        for entity in payload['entities']:
-            entity_content = str(entity)
-            keywords.update(extract_java_keywords(entity_content))
+    # Extract from repositories and entities
+    sources.extend(extract_java_keywords(text) for text in repo_texts)
+    sources.extend(extract_java_keywords(text) for text in entity_texts)
     
     # Add some general optimization keywords
-    keywords.update(['index', 'optimization', 'performance', 'query', 'sql', 'jpa', 'hibernate'])
+    sources.append(['index', 'optimization', 'performance', 'query', 'sql', 'jpa', 'hibernate'])
     
-    # Normalize all keywords
-    normalized_keywords = normalize_keywords(keywords)
+    # Merge and normalize every stream into a single set in one go
+    normalized_keywords = frozenset(normalize_keywords(chain.from_iterable(sources)))
     
-    print(f"🔍 Extracted {len(normalized_keywords)} normalized keywords: {normalized_keywords[:10]}...")
+    logger.info("🔍 Extracted %d normalized keywords", len(normalized_keywords))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("🔍 Keywords: %s...", sorted(normalized_keywords)[:10])
     return normalized_keywords
 
 def extract_sql_keywords(sql_query, method_name=None):
-    """Enhanced SQL keyword extraction"""
-    keywords = set()
-    
+    """Enhanced SQL keyword extraction, yielding keywords as they are found"""
     if not sql_query:
-        return keywords
-    
-    # Table names (improved pattern)
-    tables = re.findall(r'(?:FROM|JOIN|UPDATE|INTO|TABLE)\s+([a-zA-Z0-9_]+)', sql_query, re.IGNORECASE)
-    keywords.update(tables)
-    
-    # Column names (improved - remove SQL keywords first)
-    sql_clean = re.sub(r'\b(SELECT|FROM|WHERE|JOIN|ON|AND|OR|ORDER|BY|GROUP|HAVING|LIMIT|DISTINCT|COUNT|SUM|AVG|MAX|MIN)\b', '', sql_query, flags=re.IGNORECASE)
-    columns = re.findall(r'\b([a-zA-Z][a-zA-Z0-9_]*)', sql_clean)
-    keywords.update([col.lower() for col in columns if len(col) > 2])
+        return
     
-    # SQL operation keywords
-    sql_operations = re.findall(r'\b(CREATE|ALTER|DROP|INDEX|CONSTRAINT|PRIMARY|FOREIGN|KEY|BATCH|CACHE|FETCH|LAZY|EAGER)\b', sql_query, re.IGNORECASE)
-    keywords.update([k.lower() for k in sql_operations])
+    # Single pass over the identifiers: operation keywords are kept as-is and
+    # everything else that isn't SQL syntax (table and column names alike) is
+    # kept as a name
+    for match in _IDENT_RE.finditer(sql_query):
+        token = match.group().lower()
+        if token in _SQL_OPERATIONS or (token not in _SQL_KEYWORDS and len(token) > 2):
+            yield token
     
     # JPA method keywords (improved camelCase splitting)
     if method_name:
         # Split camelCase and PascalCase
-        method_parts = re.findall(r'[A-Z]?[a-z]+|[A-Z]+(?=[A-Z][a-z]|\b)', method_name)
-        keywords.update([part.lower() for part in method_parts if len(part) > 2])
+        for part in _CAMEL_SPLIT_RE.findall(method_name):
+            if len(part) > 2:
+                yield part.lower()
         
         # Also extract whole method name
-        keywords.add(method_name.lower())
-    
-    return keywords
+        yield method_name.lower()
 
 def extract_java_keywords(content):
-    """Extract Java/Kotlin specific keywords from code content"""
-    keywords = set()
-    
+    """Extract Java/Kotlin specific keywords from code content, yielding them as they are found"""
     if not content:
-        return keywords
+        return
     
     content_str = str(content)
     
     # Class names (improved pattern)
-    class_names = re.findall(r'(?:class|interface|enum)\s+([A-Za-z][A-Za-z0-9_]*)', content_str, re.IGNORECASE)
-    keywords.update([name.lower() for name in class_names])
+    for name in _CLASS_RE.findall(content_str):
+        yield name.lower()
     
     # Annotations (JPA, Spring, etc.)
-    annotations = re.findall(r'@([A-Za-z][A-Za-z0-9_]*)', content_str)
-    keywords.update([ann.lower() for ann in annotations])
+    for ann in _ANNOTATION_RE.findall(content_str):
+        yield ann.lower()
     
-    # Method names (camelCase splitting)
-    methods = re.findall(r'(?:public|private|protected)?\s*\w+\s+([a-z][A-Za-z0-9_]*)\s*\(', content_str)
-    for method in methods:
-        method_parts = re.findall(r'[A-Z]?[a-z]+|[A-Z]+(?=[A-Z][a-z]|\b)', method)
-        keywords.update([part.lower() for part in method_parts if len(part) > 2])
+    # Method names (camelCase splitting, one scan over all of them)
+    for part in _CAMEL_SPLIT_RE.findall(' '.join(_METHOD_RE.findall(content_str))):
+        if len(part) > 2:
+            yield part.lower()
     
     # Field/variable names
-    fields = re.findall(r'(?:private|public|protected)\s+\w+\s+([a-zA-Z][a-zA-Z0-9_]*)', content_str)
-    keywords.update([field.lower() for field in fields])
+    for field in _FIELD_RE.findall(content_str):
+        yield field.lower()
     
     # Package names
-    packages = re.findall(r'package\s+([a-zA-Z][a-zA-Z0-9_.]*)', content_str)
-    for package in packages:
-        package_parts = package.split('.')
-        keywords.update([part.lower() for part in package_parts if len(part) > 2])
-    
-    return keywords
+    for package in _PACKAGE_RE.findall(content_str):
+        for part in package.split('.'):
+            if len(part) > 2:
+                yield part.lower()
 
 def extract_content_keywords(content):
-    """Enhanced content keyword extraction"""
-    keywords = set()
-    
+    """Enhanced content keyword extraction, yielding keywords as they are found"""
     if not content:
-        return keywords
+        return
     
     # Java/Kotlin keywords
-    keywords.update(extract_java_keywords(content))
+    yield from extract_java_keywords(content)
     
     # Database and JPA related terms
-    db_terms = re.findall(r'\b(entity|repository|service|controller|table|column|join|select|where|index|optimization|performance|query|sql|database|hibernate|jpa|spring|batch|cache|fetch|lazy|eager)\b', content, re.IGNORECASE)
-    keywords.update([term.lower() for term in db_terms])
+    for term in _DB_TERMS_RE.findall(content):
+        yield term.lower()
     
-    # Technical terms (camelCase aware)
-    tech_terms = re.findall(r'\b([A-Z][a-z]+(?:[A-Z][a-z]+)*|[a-z]+(?:[A-Z][a-z]+)+)\b', content)
-    for term in tech_terms:
-        # Split camelCase
-        parts = re.findall(r'[A-Z]?[a-z]+|[A-Z]+(?=[A-Z][a-z]|\b)', term)
-        keywords.update([part.lower() for part in parts if len(part) > 2])
+    # Technical terms (camelCase aware), split in one scan over all of them
+    for part in _CAMEL_SPLIT_RE.findall(' '.join(_TECH_TERMS_RE.findall(content))):
+        if len(part) > 2:
+            yield part.lower()
+
+def build_keyword_automaton(keywords):
+    """Build an Aho-Corasick automaton matching every keyword in a single pass
     
-    return keywords
+    Each keyword is weighted by its length (longer keywords get more weight).
+    """
+    automaton = ahocorasick.Automaton()
+    for keyword in keywords:
+        automaton.add_word(keyword.lower(), (keyword, len(keyword) / 5))
+    automaton.make_automaton()
+    return automaton
 
-def calculate_relevance_score(text, keywords):
-    """Calculate relevance score based on keyword matches"""
-    if not text or not keywords:
+def calculate_relevance_score(text_lower, automaton):
+    """Calculate relevance score based on keyword matches in already-lowercased text"""
+    if not text_lower or automaton.kind != ahocorasick.AHOCORASICK:
         return 0
     
-    text_lower = text.lower()
-    score = 0
-    matched_keywords = set()
+    # Count every keyword hit in one scan over the text
+    counts = Counter(match for _, match in automaton.iter(text_lower))
     
-    for keyword in keywords:
-        keyword_lower = keyword.lower()
-        count = text_lower.count(keyword_lower)
-        if count > 0:
-            # Weight by keyword length and frequency
-            keyword_score = count * (len(keyword) / 5)  # Longer keywords get more weight
-            score += keyword_score
-            matched_keywords.add(keyword)
+    # Weight by keyword length and frequency
+    score = sum(count * weight for (_, weight), count in counts.items())
     
     # Bonus for multiple unique keywords matched
-    if len(matched_keywords) > 1:
-        score *= (1 + len(matched_keywords) * 0.1)
+    if len(counts) > 1:
+        score *= (1 + len(counts) * 0.1)
     
     return score
 
-def search_payload_context(keywords, payload_json_path, max_snippets=3):
+def search_payload_context(keywords, payload, max_snippets=3, repo_texts=None, entity_texts=None):
     """Enhanced payload context search with better scoring"""
-    with open(payload_json_path, 'r') as f:
-        payload = json.load(f)
+    if repo_texts is None:
+        repo_texts = stringify_payload_section(payload, 'repositories')
+    if entity_texts is None:
+        entity_texts = stringify_payload_section(payload, 'entities')
     
+    automaton = build_keyword_automaton(keywords)
     relevant_snippets = []
     
     # Search in repository classes
     if 'repositories' in payload:
-        for repo in payload['repositories']:
-            repo_content = str(repo)
-            relevance_score = calculate_relevance_score(repo_content, keywords)
+        for repo, repo_content in zip(payload['repositories'], repo_texts):
+            relevance_score = calculate_relevance_score(repo_content.lower(), automaton)
             if relevance_score > 0:
                 snippet = f"Repository: {repo.get('name', 'Unknown')}\n{repo_content[:400]}..."
                 relevant_snippets.append((snippet, relevance_score))
     
     # Search in entity classes
     if 'entities' in payload:
-        for entity in payload['entities']:
-            entity_content = str(entity)
-            relevance_score = calculate_relevance_score(entity_content, keywords)
+        for entity, entity_content in zip(payload['entities'], entity_texts):
+            relevance_score = calculate_relevance_score(entity_content.lower(), automaton)
             if relevance_score > 0:
                 snippet = f"Entity: {entity.get('name', 'Unknown')}\n{entity_content[:400]}..."
                 relevant_snippets.append((snippet, relevance_score))
@@ -201,7 +233,7 @@ def search_payload_context(keywords, payload_json_path, max_snippets=3):
     if 'queries' in payload:
         for query in payload['queries']:
             query_content = f"SQL: {query.get('sql', '')} Method: {query.get('method_name', '')}"
-            relevance_score = calculate_relevance_score(query_content, keywords)
+            relevance_score = calculate_relevance_score(query_content.lower(), automaton)
             if relevance_score > 0:
                 snippet = f"Query: {query.get('method_name', 'Unknown')}\n{query_content}"
                 relevant_snippets.append((snippet, relevance_score))
@@ -209,131 +241,309 @@ def search_payload_context(keywords, payload_json_path, max_snippets=3):
     # Sort snippets by relevance score (highest first)
     relevant_snippets.sort(key=lambda x: x[1], reverse=True)
     
-    print(f"📊 Payload context scores: {[(score, snippet[:50]) for snippet, score in relevant_snippets[:3]]}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("📊 Payload context scores: %s", [(score, snippet[:50]) for snippet, score in relevant_snippets[:3]])
     
-    return [snippet for snippet, score in relevant_snippets[:max_snippets]]
+    return dedupe_snippets((snippet for snippet, score in relevant_snippets), max_snippets)
+
+def _shingles(text, size=3):
+    """Return the set of lowercased word n-grams of a text"""
+    words = text.lower().split()
+    return {tuple(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+
+def dedupe_snippets(snippets, max_snippets):
+    """Return up to max_snippets snippets in rank order, skipping near-duplicates
+    
+    A snippet is dropped when the Jaccard similarity of its word shingles with
+    an already kept snippet exceeds _NEAR_DUPLICATE_JACCARD. snippets may be a
+    lazy iterable; it is only consumed until enough snippets are kept.
+    """
+    kept = []
+    kept_shingles = []
+    for snippet in snippets:
+        if len(kept) >= max_snippets:
+            break
+        shingles = _shingles(snippet)
+        if any(
+            len(shingles & other) > _NEAR_DUPLICATE_JACCARD * len(shingles | other)
+            for other in kept_shingles
+        ):
+            continue
+        kept.append(snippet)
+        kept_shingles.append(shingles)
+    return kept
 
 def chunk_knowledge_base(content, chunk_size=300, overlap=50):
     """Split knowledge base into overlapping chunks for better retrieval"""
+    return [content[start:end] for start, end in chunk_offsets(content, chunk_size, overlap)]
+
+def chunk_offsets(content, chunk_size=300, overlap=50):
+    """Return the (start, end) offsets of each knowledge base chunk in content
+    
+    Chunks are delimited by word offsets, so no per-chunk word lists or joins
+    are built.
+    """
     if not content:
         return []
     
-    # Split by paragraphs first
-    paragraphs = re.split(r'\n\s*\n', content)
+    # Paragraph boundaries first
+    paragraphs = []
+    para_start = 0
+    for match in _PARA_SPLIT_RE.finditer(content):
+        paragraphs.append((para_start, match.start()))
+        para_start = match.end()
+    paragraphs.append((para_start, len(content)))
+    
     chunks = []
+    stride = chunk_size - overlap
     
-    for para in paragraphs:
-        if len(para.strip()) < 50:  # Skip very short paragraphs
+    for para_start, para_end in paragraphs:
+        spans = [match.span() for match in _WORD_RE.finditer(content, para_start, para_end)]
+        if not spans or spans[-1][1] - spans[0][0] < 50:  # Skip very short paragraphs
             continue
-            
-        words = para.split()
-        if len(words) <= chunk_size:
-            chunks.append(para.strip())
+        
+        if len(spans) <= chunk_size:
+            chunks.append((spans[0][0], spans[-1][1]))
         else:
             # Split long paragraphs into overlapping chunks
-            for i in range(0, len(words), chunk_size - overlap):
-                chunk_words = words[i:i + chunk_size]
-                chunk = ' '.join(chunk_words)
-                chunks.append(chunk.strip())
+            for i in range(0, len(spans), stride):
+                last = min(i + chunk_size, len(spans)) - 1
+                chunks.append((spans[i][0], spans[last][1]))
     
     return chunks
 
-# Global variable to cache knowledge base
+def _utf8_offsets(content, offsets):
+    """Map (start, end) character offsets in content to UTF-8 byte offsets"""
+    if content.isascii():
+        return offsets
+    
+    byte_offsets = {}
+    char_pos = byte_pos = 0
+    for pos in sorted({pos for span in offsets for pos in span}):
+        byte_pos += len(content[char_pos:pos].encode("utf-8"))
+        char_pos = pos
+        byte_offsets[pos] = byte_pos
+    return [(byte_offsets[start], byte_offsets[end]) for start, end in offsets]
+
+# Global variables to cache the memory-mapped knowledge base, the (start, end)
+# byte offsets of its chunks and the lowercased chunk texts used for matching
+_kb_mmap = None
 _kb_chunks = None
+_kb_chunks_lower = None
+# Guards the lazy KB load and the postings cache when requests are enriched
+# from several threads
+_kb_lock = threading.Lock()
+# Bumped on every (re)load so cached KB rankings never outlive their chunks
+_kb_version = 0
+# Sparse keyword -> {chunk index: hit count} columns over the KB chunks, filled
+# in lazily the first time each keyword is searched for. Payload identifiers
+# differ on every request, so this is an LRU capped at _KB_POSTINGS_MAX_SIZE
+_kb_postings = OrderedDict()
+_KB_POSTINGS_MAX_SIZE = 4096
+# Keywords found in more than this fraction of the KB chunks are dropped before scoring
+_KB_MAX_DOC_FREQ = 0.5
 
 def load_and_chunk_knowledge_base(kb_file="knowledgeBase/info.txt"):
-    """Load and chunk knowledge base once, then cache it"""
-    global _kb_chunks
-    if _kb_chunks is None:
-        try:
-            with open(kb_file, "r") as f:
-                content = f.read()
-                _kb_chunks = chunk_knowledge_base(content)
-                print(f"📚 Loaded and chunked KB into {len(_kb_chunks)} chunks")
-        except FileNotFoundError:
-            print(f"❌ Knowledge base file not found: {kb_file}")
-            _kb_chunks = []
+    """Memory-map and chunk knowledge base once, then cache the chunk offsets
+    
+    Returns the (start, end) byte offsets of each chunk in the mapped file
+    rather than the chunk strings; kb_chunk_text(index) decodes a chunk.
+    Chunking runs on the decoded text, so chunks match chunk_knowledge_base;
+    the original chunk text stays in the mapped file and is decoded on demand,
+    while the lowercased chunk texts are kept in memory for keyword matching.
+    The cache is only published once loading succeeded, so a failed load
+    (e.g. invalid UTF-8) is retried on the next call.
+    """
+    global _kb_mmap, _kb_chunks, _kb_chunks_lower, _kb_version
+    with _kb_lock:
+        if _kb_chunks is None:
+            kb_mmap = None
+            chunks = []
+            chunks_lower = []
+            try:
+                with open(kb_file, "rb") as f:
+                    if os.fstat(f.fileno()).st_size:
+                        kb_mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if kb_mmap is not None:
+                    content = str(kb_mmap, "utf-8")
+                    offsets = chunk_offsets(content)
+                    chunks = _utf8_offsets(content, offsets)
+                    chunks_lower = [content[start:end].lower() for start, end in offsets]
+                logger.info("📚 Loaded and chunked KB into %d chunks", len(chunks))
+            except FileNotFoundError:
+                logger.error("❌ Knowledge base file not found: %s", kb_file)
+            
+            _kb_version += 1
+            _kb_postings.clear()
+            _kb_mmap, _kb_chunks, _kb_chunks_lower = kb_mmap, chunks, chunks_lower
     return _kb_chunks
 
+def kb_chunk_text(index):
+    """Decode a cached KB chunk from the memory-mapped file"""
+    start, end = _kb_chunks[index]
+    return _kb_mmap[start:end].decode("utf-8")
+
 def search_knowledge_base(keywords, kb_file="knowledgeBase/info.txt", max_snippets=3):
     """Enhanced knowledge base search with chunking and scoring"""
-    print(f"🔍 Searching KB with {len(keywords)} keywords: {keywords[:5]}...")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("🔍 Searching KB with %d keywords: %s...", len(keywords), list(islice(keywords, 5)))
     
     chunks = load_and_chunk_knowledge_base(kb_file)
     if not chunks:
         return []
     
-    scored_chunks = []
-    
-    for chunk in chunks:
-        relevance_score = calculate_relevance_score(chunk, keywords)
-        if relevance_score > 0:
-            scored_chunks.append((chunk, relevance_score))
-    
-    # Sort by relevance score (highest first)
-    scored_chunks.sort(key=lambda x: x[1], reverse=True)
+    return list(_rank_kb_chunks(frozenset(keywords), max_snippets, _kb_version))
+
+@functools.lru_cache(maxsize=256)
+def _rank_kb_chunks(keywords, max_snippets, kb_version):
+    """Score the cached KB chunks against a keyword set and return the top snippets
+    
+    Memoized per (keywords, max_snippets, kb_version); kb_version keys the
+    cache to the currently loaded chunks.
+    """
+    postings = kb_keyword_postings(keywords)
+    idf = kb_keyword_idf(keywords, postings)
+    
+    # Near-universal keywords match almost every chunk and only add noise;
+    # keep them only if nothing more specific matched at all
+    min_idf = math.log(1 / _KB_MAX_DOC_FREQ) + 1
+    matching = [keyword for keyword in keywords if idf[keyword] > 0]
+    specific = [keyword for keyword in matching if idf[keyword] > min_idf]
+    
+    # Sparse matrix-vector product: only chunks that contain a keyword are touched
+    scores = Counter()
+    matched = Counter()
+    for keyword in specific or matching:
+        weight = idf[keyword]
+        for index, count in postings[keyword].items():
+            scores[index] += count * weight
+            matched[index] += 1
     
-    print(f"📊 KB search found {len(scored_chunks)} relevant chunks")
-    if scored_chunks:
-        print(f"📊 Top KB scores: {[score for chunk, score in scored_chunks[:3]]}")
+    # Bonus for multiple unique keywords matched
+    for index, unique in matched.items():
+        if unique > 1:
+            scores[index] *= (1 + unique * 0.1)
+    
+    # Highest score first, ties keep KB order. Chunks are popped off a heap,
+    # so only as many get ordered as the dedupe below ends up consuming
+    heap = [(-score, index) for index, score in scores.items()]
+    heapq.heapify(heap)
+    ranked = (heapq.heappop(heap)[1] for _ in range(len(heap)))
+    
+    logger.debug("📊 KB search found %d relevant chunks", len(scores))
+    if heap and logger.isEnabledFor(logging.DEBUG):
+        logger.debug("📊 Top KB scores: %s", [-score for score, index in heapq.nsmallest(3, heap)])
+    
+    # Overlapping windows of the same paragraph often rank together; chunks
+    # are only decoded until enough distinct ones are kept
+    return tuple(dedupe_snippets((kb_chunk_text(index) for index in ranked), max_snippets))
+
+def kb_keyword_postings(keywords):
+    """Return the {chunk index: hit count} column of each keyword over the cached KB chunks
+    
+    Chunks are only scanned for keywords that aren't in the postings cache,
+    all of them in a single Aho-Corasick pass.
+    """
+    postings = {}
+    with _kb_lock:
+        for keyword in keywords:
+            column = _kb_postings.get(keyword)
+            if column is not None:
+                _kb_postings.move_to_end(keyword)
+                postings[keyword] = column
+    
+    missing = [keyword for keyword in keywords if keyword not in postings]
+    if missing:
+        columns = {keyword: {} for keyword in missing}
+        automaton = build_keyword_automaton(missing)
+        for index, chunk_lower in enumerate(_kb_chunks_lower):
+            for _, (keyword, _) in automaton.iter(chunk_lower):
+                column = columns[keyword]
+                column[index] = column.get(index, 0) + 1
+        postings.update(columns)
+        
+        with _kb_lock:
+            _kb_postings.update(columns)
+            while len(_kb_postings) > _KB_POSTINGS_MAX_SIZE:
+                _kb_postings.popitem(last=False)
     
-    return [chunk for chunk, score in scored_chunks[:max_snippets]]
+    return postings
 
-def format_context_for_injection(relevant_context, kb_snippets):
-    """Format the context nicely for injection into the prompt"""
-    context_parts = []
-    
-    if relevant_context:
-        context_parts.append("=== RELEVANT CODE CONTEXT ===")
-        for i, context in enumerate(relevant_context, 1):
-            context_parts.append(f"Context {i}:")
-            context_parts.append(context)
-            context_parts.append("")
-    
-    if kb_snippets:
-        context_parts.append("=== OPTIMIZATION KNOWLEDGE BASE ===")
-        for i, snippet in enumerate(kb_snippets, 1):
-            context_parts.append(f"Knowledge {i}:")
-            context_parts.append(snippet)
-            context_parts.append("")
-    
-    return "\n".join(context_parts)
+def kb_keyword_idf(keywords, postings):
+    """Return the IDF of each keyword over the cached KB chunks, given their postings
+    
+    Keywords that don't occur in the knowledge base get an IDF of 0.
+    """
+    total = len(_kb_chunks)
+    return {
+        keyword: math.log(total / len(postings[keyword])) + 1 if postings[keyword] else 0.0
+        for keyword in keywords
+    }
 
-def enrich_payload_with_rag(payload_json_path, max_context_tokens=200000):
-    """Enhanced main function to enrich the payload with RAG context"""
-    print("🚀 Starting RAG enrichment...")
+def format_context_for_injection(relevant_context, kb_snippets, max_chars=None):
+    """Format the context nicely for injection into the prompt
+    
+    With max_chars, formatting stops as soon as the limit is passed instead of
+    building the whole context and slicing it afterwards.
+    """
+    sections = (
+        ("=== RELEVANT CODE CONTEXT ===", "Context", relevant_context),
+        ("=== OPTIMIZATION KNOWLEDGE BASE ===", "Knowledge", kb_snippets),
+    )
+    # Entries end in a blank line; the final newline is trimmed below, so the
+    # limit is only exceeded once the buffer is past max_chars + 1
+    limit = max_chars + 1 if max_chars is not None else None
+    
+    buf = io.StringIO()
+    for header, label, items in sections:
+        if not items:
+            continue
+        buf.write(f"{header}\n")
+        for i, item in enumerate(items, 1):
+            buf.write(f"{label} {i}:\n{item}\n\n")
+            if limit is not None and buf.tell() > limit:
+                break
+        if limit is not None and buf.tell() > limit:
+            break
+    
+    context_text = buf.getvalue()[:-1]
+    if max_chars is not None and len(context_text) > max_chars:
+        logger.warning("⚠️ Context truncated to fit %d chars", max_chars)
+        return context_text[:max_chars] + "\n\n[Context truncated due to token limit]"
+    return context_text
+
+def enrich_payload_with_rag_dict(payload, max_context_tokens=200000):
+    """Enrich an already-parsed payload with RAG context, in place, and return it"""
+    logger.info("🚀 Starting RAG enrichment...")
+    
+    # Stringify repositories and entities once for both extraction and scoring
+    repo_texts = stringify_payload_section(payload, 'repositories')
+    entity_texts = stringify_payload_section(payload, 'entities')
     
     # Extract and normalize keywords from existing payload
-    keywords = extract_keywords_from_payload(payload_json_path)
+    keywords = extract_keywords_from_payload(payload, repo_texts, entity_texts)
     
     if not keywords:
-        print("❌ No keywords extracted, skipping RAG enrichment")
-        return
+        logger.info("❌ No keywords extracted, skipping RAG enrichment")
+        return payload
     
     # Search for relevant context within the payload
-    relevant_context = search_payload_context(keywords, payload_json_path, max_snippets=4)
-    print(f"📝 Found {len(relevant_context)} payload context snippets")
+    relevant_context = search_payload_context(
+        keywords, payload, max_snippets=4, repo_texts=repo_texts, entity_texts=entity_texts
+    )
+    logger.info("📝 Found %d payload context snippets", len(relevant_context))
     
     # Search the knowledge base
     kb_snippets = search_knowledge_base(keywords, max_snippets=3)
-    print(f"📚 Found {len(kb_snippets)} KB snippets")
-    
-    # Load and modify the payload
-    with open(payload_json_path, 'r') as f:
-        payload = json.load(f)
+    logger.info("📚 Found %d KB snippets", len(kb_snippets))
     
     # Add context if we found any and there are messages to enrich
     if (relevant_context or kb_snippets) and 'messages' in payload:
-        print("✅ Adding context to messages")
-        
-        # Format context nicely
-        context_text = format_context_for_injection(relevant_context, kb_snippets)
+        logger.debug("✅ Adding context to messages")
         
-        # Truncate context text to fit within token limit (rough estimation: 4 chars per token)
+        # Format context nicely, stopping at the token limit (rough estimation: 4 chars per token)
         max_context_chars = max_context_tokens * 4
-        if len(context_text) > max_context_chars:
-            context_text = context_text[:max_context_chars] + "\n\n[Context truncated due to token limit]"
-            print(f"⚠️ Context truncated to fit {max_context_tokens} token limit")
+        context_text = format_context_for_injection(relevant_context, kb_snippets, max_chars=max_context_chars)
         
         rag_addition = context_text
         
@@ -341,14 +551,26 @@ def enrich_payload_with_rag(payload_json_path, max_context_tokens=200000):
         for message in reversed(payload['messages']):
             if message.get('role') == 'user':
                 message['content'] += rag_addition
-                print(f"✅ Added {len(context_text)} chars of context to user message")
+                logger.info("✅ Added %d chars of context to user message", len(context_text))
                 break
     else:
-        print(f"❌ No context to add. Context: {len(relevant_context)}, KB: {len(kb_snippets)}, Messages: {'messages' in payload}")
+        logger.info(
+            "❌ No context to add. Context: %d, KB: %d, Messages: %s",
+            len(relevant_context), len(kb_snippets), 'messages' in payload
+        )
+    
+    logger.info("🎉 RAG enrichment completed!")
+    return payload
+
+def enrich_payload_with_rag(payload_json_path, max_context_tokens=200000):
+    """Enrich a payload.json file on disk with RAG context"""
+    with open(payload_json_path, 'rb', buffering=_READ_BUFFER_SIZE) as f:
+        payload = orjson.loads(f.read())
+    
+    enrich_payload_with_rag_dict(payload, max_context_tokens=max_context_tokens)
     
     # Write back the enriched payload
-    with open(payload_json_path, 'w') as f:
-        json.dump(payload, f, indent=2)
+    with open(payload_json_path, 'wb') as f:
+        f.write(orjson.dumps(payload, option=orjson.OPT_INDENT_2))
     
-    print("🎉 RAG enrichment completed!")
     return payload
@@ -0,0 +1,64 @@
+from typing import Any, Dict
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from main import app
+
+client = TestClient(app)
+
+# An endpoint with the original pydantic-validated signature, kept as a
+# reference for the validation errors FastAPI produces for a dict body
+baseline_app = FastAPI()
+
+
+@baseline_app.post("/optimize_sql")
+async def baseline_optimize_sql(payload: Dict[str, Any], max_context_tokens: int = 200000):
+    return {"enriched_payload": payload}
+
+
+baseline_client = TestClient(baseline_app)
+
+
+def strip_details(errors):
+    return [
+        {key: value for key, value in error.items() if key not in ("url", "ctx")}
+        for error in errors["detail"]
+    ]
+
+
+@pytest.mark.parametrize("body", [
+    b"",
+    b"{",
+    b'{"queries": [}',
+    b"[]",
+    b'"select * from orders"',
+    b"42",
+    b"null",
+])
+def test_invalid_bodies_match_baseline_errors(body):
+    headers = {"Content-Type": "application/json"}
+    response = client.post("/optimize_sql", content=body, headers=headers)
+    expected = baseline_client.post("/optimize_sql", content=body, headers=headers)
+    
+    assert response.status_code == expected.status_code == 422
+    # The docs url and the JSON parser's own error message aren't part of the contract
+    assert strip_details(response.json()) == strip_details(expected.json())
+
+
+def test_over_range_integers_are_accepted():
+    body = b'{"id": 123456789012345678901234, "offset": -99999999999999999999}'
+    response = client.post("/optimize_sql", content=body, headers={"Content-Type": "application/json"})
+    
+    assert response.status_code == 200
+    # orjson parses integers past 64 bits as floats
+    assert response.json()["enriched_payload"] == {"id": 1.2345678901234569e23, "offset": -1e20}
+
+
+def test_request_body_is_documented():
+    request_body = app.openapi()["paths"]["/optimize_sql"]["post"]["requestBody"]
+    assert request_body == {
+        "required": True,
+        "content": {"application/json": {"schema": {"type": "object", "title": "Payload"}}},
+    }
@@ -0,0 +1,272 @@
+import re
+from pathlib import Path
+
+import pytest
+
+import rag_lite
+from rag_lite import (
+    _shingles,
+    chunk_knowledge_base,
+    dedupe_snippets,
+    extract_sql_keywords,
+    format_context_for_injection,
+    kb_keyword_postings,
+    normalize_keywords,
+    search_knowledge_base,
+)
+
+
+def baseline_chunk_knowledge_base(content, chunk_size=300, overlap=50):
+    """The original paragraph/word-list chunker, kept as a reference"""
+    if not content:
+        return []
+    
+    paragraphs = re.split(r'\n\s*\n', content)
+    chunks = []
+    
+    for para in paragraphs:
+        if len(para.strip()) < 50:
+            continue
+        
+        words = para.split()
+        if len(words) <= chunk_size:
+            chunks.append(para.strip())
+        else:
+            for i in range(0, len(words), chunk_size - overlap):
+                chunk_words = words[i:i + chunk_size]
+                chunk = ' '.join(chunk_words)
+                chunks.append(chunk.strip())
+    
+    return chunks
+
+
+def normalize_whitespace(chunks):
+    return [' '.join(chunk.split()) for chunk in chunks]
+
+
+KB_FILE = Path(__file__).parent / "knowledgeBase" / "info.txt"
+
+
+def read_kb():
+    return KB_FILE.read_text(encoding="utf-8")
+
+
+def test_chunk_knowledge_base_matches_baseline_on_kb():
+    content = read_kb()
+    assert chunk_knowledge_base(content) == baseline_chunk_knowledge_base(content)
+
+
+@pytest.mark.parametrize("chunk_size,overlap", [(20, 5), (7, 3), (10, 0)])
+def test_chunk_knowledge_base_windows_match_baseline(chunk_size, overlap):
+    # Windows keep the original whitespace between words, so compare word content
+    content = read_kb()
+    assert normalize_whitespace(chunk_knowledge_base(content, chunk_size, overlap)) == \
+        normalize_whitespace(baseline_chunk_knowledge_base(content, chunk_size, overlap))
+
+
+@pytest.mark.parametrize("content", [
+    "",
+    "\n\n  \n",
+    "too short\n\nalso short",
+    " ".join(f"word{i}" for i in range(1000)),
+    "intro paragraph that is long enough to be kept as its own chunk\n \n" + " ".join(["x"] * 700),
+    "Café paragraph with ünïcode words that is long enough to be kept\n\u00a0\nñ " * 3,
+])
+def test_chunk_knowledge_base_edge_cases_match_baseline(content):
+    assert chunk_knowledge_base(content) == baseline_chunk_knowledge_base(content)
+
+
+def baseline_format_context(relevant_context, kb_snippets, max_chars):
+    """The original build-then-slice context formatting, kept as a reference"""
+    context_parts = []
+    
+    if relevant_context:
+        context_parts.append("=== RELEVANT CODE CONTEXT ===")
+        for i, context in enumerate(relevant_context, 1):
+            context_parts.append(f"Context {i}:")
+            context_parts.append(context)
+            context_parts.append("")
+    
+    if kb_snippets:
+        context_parts.append("=== OPTIMIZATION KNOWLEDGE BASE ===")
+        for i, snippet in enumerate(kb_snippets, 1):
+            context_parts.append(f"Knowledge {i}:")
+            context_parts.append(snippet)
+            context_parts.append("")
+    
+    context_text = "\n".join(context_parts)
+    if max_chars is not None and len(context_text) > max_chars:
+        context_text = context_text[:max_chars] + "\n\n[Context truncated due to token limit]"
+    return context_text
+
+
+CONTEXTS = [
+    ([], []),
+    (["Repository: OrderRepository\nclass OrderRepository"], []),
+    ([], ["Use JOIN FETCH to avoid N+1 queries."]),
+    (["query one", "query two"], ["batch inserts", "second-level cache", ""]),
+]
+
+
+@pytest.mark.parametrize("relevant_context,kb_snippets", CONTEXTS)
+def test_format_context_without_limit_matches_baseline(relevant_context, kb_snippets):
+    assert format_context_for_injection(relevant_context, kb_snippets) == \
+        baseline_format_context(relevant_context, kb_snippets, None)
+
+
+@pytest.mark.parametrize("relevant_context,kb_snippets", CONTEXTS)
+def test_format_context_truncation_edges_match_baseline(relevant_context, kb_snippets):
+    full_length = len(baseline_format_context(relevant_context, kb_snippets, None))
+    # Zero, one character over the limit, exactly at the limit and well past it
+    for max_chars in {0, max(full_length - 1, 0), full_length, full_length + 1, full_length // 2}:
+        assert format_context_for_injection(relevant_context, kb_snippets, max_chars=max_chars) == \
+            baseline_format_context(relevant_context, kb_snippets, max_chars), max_chars
+
+
+def test_format_context_marks_truncation_only_when_over_limit():
+    relevant_context, kb_snippets = CONTEXTS[-1]
+    full = format_context_for_injection(relevant_context, kb_snippets)
+    
+    assert format_context_for_injection(relevant_context, kb_snippets, max_chars=len(full)) == full
+    assert format_context_for_injection(relevant_context, kb_snippets, max_chars=len(full) - 1) == \
+        full[:-1] + "\n\n[Context truncated due to token limit]"
+    assert format_context_for_injection(relevant_context, kb_snippets, max_chars=0) == \
+        "\n\n[Context truncated due to token limit]"
+
+
+def test_format_context_matches_baseline_for_every_limit():
+    # Entry boundaries are where an early stop can lose the truncation marker
+    relevant_context, kb_snippets = CONTEXTS[-1]
+    full_length = len(baseline_format_context(relevant_context, kb_snippets, None))
+    for max_chars in range(full_length + 2):
+        assert format_context_for_injection(relevant_context, kb_snippets, max_chars=max_chars) == \
+            baseline_format_context(relevant_context, kb_snippets, max_chars), max_chars
+
+
+def baseline_extract_sql_keywords(sql_query, method_name=None):
+    """The original multi-regex SQL keyword extraction, kept as a reference"""
+    keywords = set()
+    
+    if not sql_query:
+        return keywords
+    
+    tables = re.findall(r'(?:FROM|JOIN|UPDATE|INTO|TABLE)\s+([a-zA-Z0-9_]+)', sql_query, re.IGNORECASE)
+    keywords.update(tables)
+    
+    sql_clean = re.sub(r'\b(SELECT|FROM|WHERE|JOIN|ON|AND|OR|ORDER|BY|GROUP|HAVING|LIMIT|DISTINCT|COUNT|SUM|AVG|MAX|MIN)\b', '', sql_query, flags=re.IGNORECASE)
+    columns = re.findall(r'\b([a-zA-Z][a-zA-Z0-9_]*)', sql_clean)
+    keywords.update([col.lower() for col in columns if len(col) > 2])
+    
+    sql_operations = re.findall(r'\b(CREATE|ALTER|DROP|INDEX|CONSTRAINT|PRIMARY|FOREIGN|KEY|BATCH|CACHE|FETCH|LAZY|EAGER)\b', sql_query, re.IGNORECASE)
+    keywords.update([k.lower() for k in sql_operations])
+    
+    if method_name:
+        method_parts = re.findall(r'[A-Z]?[a-z]+|[A-Z]+(?=[A-Z][a-z]|\b)', method_name)
+        keywords.update([part.lower() for part in method_parts if len(part) > 2])
+        keywords.add(method_name.lower())
+    
+    return keywords
+
+
+@pytest.mark.parametrize("sql_query,method_name", [
+    ("", None),
+    ("SELECT * FROM orders WHERE customer_id = ?", "findByCustomerId"),
+    ("SELECT o.id, c.name FROM Orders o JOIN customers c ON o.customer_id = c.id ORDER BY o.created_at",
+     "findOrdersWithCustomer"),
+    ("SELECT * FROM (SELECT id FROM order_items GROUP BY id HAVING COUNT(*) > 1) dup", None),
+    ("UPDATE inventory SET quantity = quantity - 1 WHERE product_id IN (SELECT id FROM products)",
+     "decrementStock"),
+    ("INSERT INTO audit_log (user_id, action) VALUES (?, ?)", None),
+    ("CREATE INDEX idx_orders_status ON orders(status)", None),
+    ("select distinct p.name, p._secret from product p left join fetch p.tags", "findAllWithTags"),
+])
+def test_extract_sql_keywords_matches_baseline(sql_query, method_name):
+    # Compare what reaches the search, i.e. after normalization
+    assert set(normalize_keywords(extract_sql_keywords(sql_query, method_name))) == \
+        set(normalize_keywords(baseline_extract_sql_keywords(sql_query, method_name)))
+
+
+@pytest.fixture
+def load_kb(tmp_path, monkeypatch):
+    """Load a throwaway KB built from the given paragraphs, one chunk each"""
+    def load(paragraphs):
+        kb_file = tmp_path / "info.txt"
+        kb_file.write_text("\n\n".join(paragraphs), encoding="utf-8")
+        monkeypatch.setattr(rag_lite, "_kb_chunks", None)
+        rag_lite.load_and_chunk_knowledge_base(str(kb_file))
+        return str(kb_file)
+    return load
+
+
+KB_PARAGRAPHS = [
+    "hibernate batching groups inserts into a single round trip per flush",
+    "hibernate second level cache keeps entities between sessions warm",
+    "an index on the foreign key column speeds up hibernate joins a lot",
+    "projections fetch only needed columns instead of whole hibernate entities",
+]
+
+
+def test_search_knowledge_base_drops_near_universal_keywords(load_kb):
+    kb_file = load_kb(KB_PARAGRAPHS)
+    # 'hibernate' is in every chunk, so only the 'index' chunk is scored
+    assert search_knowledge_base({"hibernate", "index"}, kb_file, max_snippets=3) == [KB_PARAGRAPHS[2]]
+
+
+def test_search_knowledge_base_falls_back_to_universal_keywords(load_kb):
+    kb_file = load_kb(KB_PARAGRAPHS)
+    # Nothing more specific matched, so the near-universal keyword is kept
+    assert search_knowledge_base({"hibernate", "nowhere"}, kb_file, max_snippets=3) == KB_PARAGRAPHS[:3]
+    assert search_knowledge_base({"nowhere"}, kb_file, max_snippets=3) == []
+
+
+def test_kb_keyword_postings_evicts_least_recently_used(load_kb, monkeypatch):
+    load_kb(KB_PARAGRAPHS)
+    monkeypatch.setattr(rag_lite, "_KB_POSTINGS_MAX_SIZE", 2)
+    
+    assert kb_keyword_postings(["batching"]) == {"batching": {0: 1}}
+    kb_keyword_postings(["cache"])
+    kb_keyword_postings(["batching"])  # a hit makes it the most recently used
+    kb_keyword_postings(["index"])
+    assert list(rag_lite._kb_postings) == ["batching", "index"]
+    
+    # Keywords evicted within the same call are still returned
+    postings = kb_keyword_postings(["cache", "entities", "nowhere"])
+    assert postings == {"cache": {1: 1}, "entities": {1: 1, 3: 1}, "nowhere": {}}
+    assert list(rag_lite._kb_postings) == ["entities", "nowhere"]
+
+
+WORDS = [f"word{i}" for i in range(200)]
+
+
+def test_dedupe_snippets_collapses_overlapping_kb_windows():
+    # Consecutive windows share 38 of their 40 words
+    windows = chunk_knowledge_base(" ".join(WORDS[:120]), chunk_size=40, overlap=38)
+    kept = dedupe_snippets(windows, max_snippets=3)
+    
+    assert len(kept) == 3
+    assert kept[0] == windows[0]
+    assert windows[1] not in kept
+
+
+def test_dedupe_snippets_keeps_distinct_snippets_in_rank_order():
+    snippets = [" ".join(WORDS[i:i + 20]) for i in (0, 50, 100, 150)]
+    assert dedupe_snippets(snippets, max_snippets=3) == snippets[:3]
+    assert dedupe_snippets(snippets, max_snippets=10) == snippets
+
+
+def test_dedupe_snippets_fills_max_snippets_after_skipping_a_duplicate():
+    first = " ".join(WORDS[:50])
+    near_duplicate = " ".join(WORDS[1:51])
+    second = " ".join(WORDS[100:150])
+    third = " ".join(WORDS[150:200])
+    
+    assert dedupe_snippets(iter([first, near_duplicate, second, third]), max_snippets=2) == [first, second]
+
+
+def test_shingles_of_empty_and_short_snippets():
+    # Empty snippets all shingle to {()} and are duplicates of each other;
+    # shorter snippets shingle to one tuple of all their words
+    assert _shingles("") == _shingles("  \n ") == {()}
+    assert _shingles("One  TWO") == {("one", "two")}
+    assert dedupe_snippets(["", " ", "one two", "one three", "ONE two"], max_snippets=10) == \
+        ["", "one two", "one three"]